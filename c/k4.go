@@ -32,6 +32,7 @@ package main
 
 /*
 #include <stdlib.h>
+#include <stdint.h>
 struct KeyValuePair {
     char* key;
     char* value;
@@ -41,9 +42,29 @@ struct KeyValuePairArray {
     struct KeyValuePair* pairs;
     int numPairs;
 };
+
+struct SizedKeyValuePair {
+    void* key;
+    int keyLen;
+    void* value;
+    int valueLen;
+};
+
+struct U64KeyValuePair {
+    uint64_t key;
+    void* value;
+    int valueLen;
+};
+
+struct U64KeyValuePairArray {
+    struct U64KeyValuePair* pairs;
+    int numPairs;
+};
 */
 import "C"
 import (
+	"bytes"
+	"encoding/binary"
 	"github.com/guycipher/k4/v2"
 	"runtime/cgo"
 	"time"
@@ -58,6 +79,14 @@ const (
 	// Above does not export the constants to C for some odd reason
 )
 
+const (
+	FILTER_EQ     = 0 // Value equals the filter value
+	FILTER_NEQ    = 1 // Value does not equal the filter value
+	FILTER_GT     = 2 // Value is greater than the filter value
+	FILTER_LT     = 3 // Value is less than the filter value
+	FILTER_PREFIX = 4 // Value starts with the filter value
+)
+
 //export db_open
 func db_open(directory *C.char, memtableFlushThreshold C.int, compactionInterval C.int, logging C.int, compress C.int) unsafe.Pointer {
 	db, err := k4.Open(C.GoString(directory), int(memtableFlushThreshold), int(compactionInterval), logging != 0, compress != 0)
@@ -113,6 +142,42 @@ func db_put(dbPtr unsafe.Pointer, key *C.char, keyLen C.int, value *C.char, valu
 	return 0
 }
 
+//export db_put_batch
+func db_put_batch(dbPtr unsafe.Pointer, n C.int, keys **C.char, keyLens *C.int, values **C.char, valueLens *C.int, ttls *C.int64_t) C.int {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	if n <= 0 {
+		return 0
+	}
+
+	// View the C arrays as Go slices
+	keysSlice := (*[1 << 30]*C.char)(unsafe.Pointer(keys))[:n:n]
+	keyLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(keyLens))[:n:n]
+	valuesSlice := (*[1 << 30]*C.char)(unsafe.Pointer(values))[:n:n]
+	valueLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(valueLens))[:n:n]
+	ttlsSlice := (*[1 << 30]C.int64_t)(unsafe.Pointer(ttls))[:n:n]
+
+	// Put each key-value pair, stopping at the first failure
+	for i := 0; i < int(n); i++ {
+		keyBytes := C.GoBytes(unsafe.Pointer(keysSlice[i]), keyLensSlice[i])
+		valueBytes := C.GoBytes(unsafe.Pointer(valuesSlice[i]), valueLensSlice[i])
+
+		var err error
+		if ttlsSlice[i] == -1 {
+			err = db.Put(keyBytes, valueBytes, nil)
+		} else {
+			ttlDuration := time.Duration(ttlsSlice[i])
+			err = db.Put(keyBytes, valueBytes, &ttlDuration)
+		}
+		if err != nil {
+			return -1
+		}
+	}
+
+	return 0
+}
+
 //export db_get
 func db_get(dbPtr unsafe.Pointer, key *C.char, keyLen C.int) *C.char {
 	handle := cgo.Handle(dbPtr)
@@ -126,6 +191,108 @@ func db_get(dbPtr unsafe.Pointer, key *C.char, keyLen C.int) *C.char {
 	return C.CString(string(value))
 }
 
+//export db_get_sized
+func db_get_sized(dbPtr unsafe.Pointer, key *C.char, keyLen C.int) (unsafe.Pointer, C.int) {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	keyBytes := C.GoBytes(unsafe.Pointer(key), keyLen)
+	value, err := db.Get(keyBytes)
+	if err != nil || value == nil { // Get returns a nil value for missing and deleted keys
+		return nil, 0
+	}
+	return cBytes(value), C.int(len(value))
+}
+
+//export db_put_u64
+func db_put_u64(dbPtr unsafe.Pointer, key C.uint64_t, value *C.char, valueLen C.int, ttl C.int64_t) C.int {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	keyBytes := u64Key(key)
+	valueBytes := C.GoBytes(unsafe.Pointer(value), valueLen)
+
+	if ttl == -1 {
+		err := db.Put(keyBytes, valueBytes, nil)
+		if err != nil {
+			return -1
+		}
+		return 0
+	}
+
+	ttlDuration := time.Duration(ttl)
+	err := db.Put(keyBytes, valueBytes, &ttlDuration)
+	if err != nil {
+		return -1
+	}
+	return 0
+}
+
+//export db_get_u64
+func db_get_u64(dbPtr unsafe.Pointer, key C.uint64_t) (unsafe.Pointer, C.int) {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	value, err := db.Get(u64Key(key))
+	if err != nil || value == nil { // Get returns a nil value for a missing or deleted key
+		return nil, 0
+	}
+	return cBytes(value), C.int(len(value))
+}
+
+//export range_u64
+func range_u64(dbPtr unsafe.Pointer, start C.uint64_t, end C.uint64_t) C.struct_U64KeyValuePairArray {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	keysValuePairs, err := db.Range(u64Key(start), u64Key(end))
+	if err != nil {
+		return C.struct_U64KeyValuePairArray{pairs: nil, numPairs: 0}
+	}
+
+	// Numeric keys share the keyspace with every other key, keep the 8 byte keys in the
+	// range, any 8 byte key is decoded whether or not a u64 function wrote it
+	n := 0
+	for _, kv := range *keysValuePairs {
+		if len(kv.Key) == 8 {
+			n++
+		}
+	}
+	if n == 0 {
+		return C.struct_U64KeyValuePairArray{pairs: nil, numPairs: 0}
+	}
+
+	// Allocate memory for the array of U64KeyValuePair structs
+	cArray := C.malloc(C.size_t(n) * C.size_t(unsafe.Sizeof(C.struct_U64KeyValuePair{})))
+	cKeyValuePairs := (*[1 << 30]C.struct_U64KeyValuePair)(cArray)[:n:n]
+
+	// Populate the array with the decoded keys and sized values
+	i := 0
+	for _, kv := range *keysValuePairs {
+		if len(kv.Key) != 8 {
+			continue
+		}
+		cKeyValuePairs[i].key = C.uint64_t(binary.BigEndian.Uint64(kv.Key))
+		cKeyValuePairs[i].value = cBytes(kv.Value)
+		cKeyValuePairs[i].valueLen = C.int(len(kv.Value))
+		i++
+	}
+
+	return C.struct_U64KeyValuePairArray{pairs: (*C.struct_U64KeyValuePair)(cArray), numPairs: C.int(n)}
+}
+
+//export db_delete_u64
+func db_delete_u64(dbPtr unsafe.Pointer, key C.uint64_t) C.int {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	err := db.Delete(u64Key(key))
+	if err != nil {
+		return -1
+	}
+	return 0
+}
+
 //export db_delete
 func db_delete(dbPtr unsafe.Pointer, key *C.char, keyLen C.int) C.int {
 	handle := cgo.Handle(dbPtr)
@@ -156,6 +323,10 @@ func add_operation(txPtr unsafe.Pointer, operation C.int, key *C.char, keyLen C.
 	txnHandle := cgo.Handle(txPtr)
 	txn := txnHandle.Value().(*k4.Transaction)
 
+	if operation != OPR_PUT && operation != OPR_DEL {
+		return -1
+	}
+
 	keyBytes := C.GoBytes(unsafe.Pointer(key), keyLen)
 	valueBytes := C.GoBytes(unsafe.Pointer(value), valueLen)
 
@@ -164,6 +335,77 @@ func add_operation(txPtr unsafe.Pointer, operation C.int, key *C.char, keyLen C.
 	return 0
 }
 
+//export add_operation_batch
+func add_operation_batch(txPtr unsafe.Pointer, n C.int, operations *C.int, keys **C.char, keyLens *C.int, values **C.char, valueLens *C.int) C.int {
+	txnHandle := cgo.Handle(txPtr)
+	txn := txnHandle.Value().(*k4.Transaction)
+
+	if n <= 0 {
+		return 0
+	}
+
+	// View the C arrays as Go slices
+	operationsSlice := (*[1 << 30]C.int)(unsafe.Pointer(operations))[:n:n]
+	keysSlice := (*[1 << 30]*C.char)(unsafe.Pointer(keys))[:n:n]
+	keyLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(keyLens))[:n:n]
+	valuesSlice := (*[1 << 30]*C.char)(unsafe.Pointer(values))[:n:n]
+	valueLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(valueLens))[:n:n]
+
+	if !validOperations(operationsSlice) {
+		return -1
+	}
+
+	for i := 0; i < int(n); i++ {
+		keyBytes := C.GoBytes(unsafe.Pointer(keysSlice[i]), keyLensSlice[i])
+		valueBytes := C.GoBytes(unsafe.Pointer(valuesSlice[i]), valueLensSlice[i])
+
+		txn.AddOperation(k4.OPR_CODE(operationsSlice[i]), keyBytes, valueBytes)
+	}
+
+	return 0
+}
+
+//export db_write_batch
+func db_write_batch(dbPtr unsafe.Pointer, n C.int, operations *C.int, keys **C.char, keyLens *C.int, values **C.char, valueLens *C.int) C.int {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	if n <= 0 {
+		return 0
+	}
+
+	// View the C arrays as Go slices
+	operationsSlice := (*[1 << 30]C.int)(unsafe.Pointer(operations))[:n:n]
+	keysSlice := (*[1 << 30]*C.char)(unsafe.Pointer(keys))[:n:n]
+	keyLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(keyLens))[:n:n]
+	valuesSlice := (*[1 << 30]*C.char)(unsafe.Pointer(values))[:n:n]
+	valueLensSlice := (*[1 << 30]C.int)(unsafe.Pointer(valueLens))[:n:n]
+
+	// Reject the batch before beginning the transaction, Commit rolls back on an
+	// unknown operation and would never return
+	if !validOperations(operationsSlice) {
+		return -1
+	}
+
+	// The batch is applied as a transaction, so all operations are written to the memtable
+	// and queued to the WAL under a single lock
+	txn := db.BeginTransaction()
+	defer txn.Remove(db)
+
+	for i := 0; i < int(n); i++ {
+		keyBytes := C.GoBytes(unsafe.Pointer(keysSlice[i]), keyLensSlice[i])
+		valueBytes := C.GoBytes(unsafe.Pointer(valuesSlice[i]), valueLensSlice[i])
+
+		txn.AddOperation(k4.OPR_CODE(operationsSlice[i]), keyBytes, valueBytes)
+	}
+
+	err := txn.Commit(db)
+	if err != nil {
+		return -1
+	}
+	return 0
+}
+
 //export remove_transaction
 func remove_transaction(dbPtr unsafe.Pointer, txPtr unsafe.Pointer) {
 	handle := cgo.Handle(dbPtr)
@@ -248,6 +490,56 @@ func range_(dbPtr unsafe.Pointer, start *C.char, startLen C.int, end *C.char, en
 	return C.struct_KeyValuePairArray{pairs: (*C.struct_KeyValuePair)(cArray), numPairs: C.int(len(keysValuePairsSlice))}
 }
 
+//export range_filter
+func range_filter(dbPtr unsafe.Pointer, start *C.char, startLen C.int, end *C.char, endLen C.int, op C.int, value *C.char, valueLen C.int) C.struct_KeyValuePairArray {
+	handle := cgo.Handle(dbPtr)
+	db := handle.Value().(*k4.K4)
+
+	startBytes := C.GoBytes(unsafe.Pointer(start), startLen)
+	endBytes := C.GoBytes(unsafe.Pointer(end), endLen)
+	valueBytes := C.GoBytes(unsafe.Pointer(value), valueLen)
+	keysValuePairs, err := db.Range(startBytes, endBytes)
+	if err != nil {
+		return C.struct_KeyValuePairArray{pairs: nil, numPairs: 0}
+	}
+
+	// Keep only the key-value pairs whose value matches the filter
+	keysValuePairsSlice := make([]*k4.KV, 0, len(*keysValuePairs))
+	for _, kv := range *keysValuePairs {
+		var match bool
+		switch op {
+		case FILTER_EQ:
+			match = bytes.Equal(kv.Value, valueBytes)
+		case FILTER_NEQ:
+			match = !bytes.Equal(kv.Value, valueBytes)
+		case FILTER_GT:
+			match = bytes.Compare(kv.Value, valueBytes) > 0
+		case FILTER_LT:
+			match = bytes.Compare(kv.Value, valueBytes) < 0
+		case FILTER_PREFIX:
+			match = bytes.HasPrefix(kv.Value, valueBytes)
+		default:
+			return C.struct_KeyValuePairArray{pairs: nil, numPairs: 0}
+		}
+
+		if match {
+			keysValuePairsSlice = append(keysValuePairsSlice, kv)
+		}
+	}
+
+	// Allocate memory for the array of KeyValuePair structs
+	cArray := C.malloc(C.size_t(len(keysValuePairsSlice)) * C.size_t(unsafe.Sizeof(C.struct_KeyValuePair{})))
+	cKeyValuePairs := (*[1 << 30]C.struct_KeyValuePair)(cArray)[:len(keysValuePairsSlice):len(keysValuePairsSlice)]
+
+	// Populate the array with key-value pairs
+	for i, kv := range keysValuePairsSlice {
+		cKeyValuePairs[i].key = C.CString(string(kv.Key))
+		cKeyValuePairs[i].value = C.CString(string(kv.Value))
+	}
+
+	return C.struct_KeyValuePairArray{pairs: (*C.struct_KeyValuePair)(cArray), numPairs: C.int(len(keysValuePairsSlice))}
+}
+
 //export nrange
 func nrange(dbPtr unsafe.Pointer, start *C.char, startLen C.int, end *C.char, endLen C.int) C.struct_KeyValuePairArray {
 	handle := cgo.Handle(dbPtr)
@@ -427,6 +719,9 @@ func new_iterator(dbPtr unsafe.Pointer) unsafe.Pointer {
 func iter_next(iterPtr unsafe.Pointer) (*C.char, *C.char) {
 	iterHandle := cgo.Handle(iterPtr)
 	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return nil, nil
+	}
 
 	key, value := iter.Next()
 	if key == nil {
@@ -440,6 +735,9 @@ func iter_next(iterPtr unsafe.Pointer) (*C.char, *C.char) {
 func iter_prev(iterPtr unsafe.Pointer) (*C.char, *C.char) {
 	iterHandle := cgo.Handle(iterPtr)
 	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return nil, nil
+	}
 
 	key, value := iter.Prev()
 	if key == nil {
@@ -449,10 +747,78 @@ func iter_prev(iterPtr unsafe.Pointer) (*C.char, *C.char) {
 	return C.CString(string(key)), C.CString(string(value))
 }
 
+//export iter_next_sized
+func iter_next_sized(iterPtr unsafe.Pointer) (unsafe.Pointer, C.int, unsafe.Pointer, C.int) {
+	iterHandle := cgo.Handle(iterPtr)
+	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return nil, 0, nil, 0
+	}
+
+	key, value := iter.Next()
+	if len(key) == 0 { // An exhausted iterator can keep returning empty keys
+		return nil, 0, nil, 0
+	}
+
+	return cBytes(key), C.int(len(key)), cBytes(value), C.int(len(value))
+}
+
+//export iter_prev_sized
+func iter_prev_sized(iterPtr unsafe.Pointer) (unsafe.Pointer, C.int, unsafe.Pointer, C.int) {
+	iterHandle := cgo.Handle(iterPtr)
+	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return nil, 0, nil, 0
+	}
+
+	key, value := iter.Prev()
+	if len(key) == 0 { // An exhausted iterator can keep returning empty keys
+		return nil, 0, nil, 0
+	}
+
+	return cBytes(key), C.int(len(key)), cBytes(value), C.int(len(value))
+}
+
+//export iter_next_batch
+func iter_next_batch(iterPtr unsafe.Pointer, out *C.struct_SizedKeyValuePair, capacity C.int) C.int {
+	iterHandle := cgo.Handle(iterPtr)
+	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return 0
+	}
+
+	if capacity <= 0 {
+		return 0
+	}
+
+	// View the caller's buffer as a Go slice
+	pairs := (*[1 << 30]C.struct_SizedKeyValuePair)(unsafe.Pointer(out))[:capacity:capacity]
+
+	// Fill the buffer until it is full or the iterator is exhausted
+	n := 0
+	for n < int(capacity) {
+		key, value := iter.Next()
+		if len(key) == 0 { // An exhausted iterator can keep returning empty keys
+			break
+		}
+
+		pairs[n].key = cBytes(key)
+		pairs[n].keyLen = C.int(len(key))
+		pairs[n].value = cBytes(value)
+		pairs[n].valueLen = C.int(len(value))
+		n++
+	}
+
+	return C.int(n)
+}
+
 //export iter_reset
 func iter_reset(iterPtr unsafe.Pointer) {
 	iterHandle := cgo.Handle(iterPtr)
 	iter := iterHandle.Value().(*k4.Iterator)
+	if iter == nil { // NewIterator returns nil while the database has no sstables
+		return
+	}
 
 	iter.Reset()
 }
@@ -488,4 +854,77 @@ func escalate_compaction(dbPtr unsafe.Pointer) C.int {
 	return 0
 }
 
+//export free_kv_pairs
+func free_kv_pairs(pairs *C.struct_KeyValuePair, n C.int) {
+	if n <= 0 {
+		return
+	}
+
+	pairsSlice := (*[1 << 30]C.struct_KeyValuePair)(unsafe.Pointer(pairs))[:n:n]
+	for i := range pairsSlice {
+		C.free(unsafe.Pointer(pairsSlice[i].key))
+		C.free(unsafe.Pointer(pairsSlice[i].value))
+	}
+}
+
+//export free_sized_kv_pairs
+func free_sized_kv_pairs(pairs *C.struct_SizedKeyValuePair, n C.int) {
+	if n <= 0 {
+		return
+	}
+
+	pairsSlice := (*[1 << 30]C.struct_SizedKeyValuePair)(unsafe.Pointer(pairs))[:n:n]
+	for i := range pairsSlice {
+		C.free(pairsSlice[i].key)
+		C.free(pairsSlice[i].value)
+	}
+}
+
+//export free_kv_array
+func free_kv_array(arr C.struct_KeyValuePairArray) {
+	free_kv_pairs(arr.pairs, arr.numPairs)
+	C.free(unsafe.Pointer(arr.pairs))
+}
+
+//export free_u64_kv_array
+func free_u64_kv_array(arr C.struct_U64KeyValuePairArray) {
+	if arr.numPairs > 0 {
+		pairsSlice := (*[1 << 30]C.struct_U64KeyValuePair)(unsafe.Pointer(arr.pairs))[:arr.numPairs:arr.numPairs]
+		for i := range pairsSlice {
+			C.free(pairsSlice[i].value)
+		}
+	}
+	C.free(unsafe.Pointer(arr.pairs))
+}
+
+//export free_value
+func free_value(ptr unsafe.Pointer) {
+	C.free(ptr)
+}
+
+// validOperations reports whether every operation code is OPR_PUT or OPR_DEL
+func validOperations(operations []C.int) bool {
+	for _, op := range operations {
+		if op != OPR_PUT && op != OPR_DEL {
+			return false
+		}
+	}
+	return true
+}
+
+// u64Key encodes a numeric key as 8 big-endian bytes, so keys sort in numeric order
+func u64Key(key C.uint64_t) []byte {
+	keyBytes := make([]byte, 8)
+	binary.BigEndian.PutUint64(keyBytes, uint64(key))
+	return keyBytes
+}
+
+// cBytes copies b into C memory without relying on a NUL terminator, so values may contain
+// any byte. One extra byte is allocated so an empty value is never returned as NULL.
+func cBytes(b []byte) unsafe.Pointer {
+	ptr := C.malloc(C.size_t(len(b) + 1))
+	copy((*[1 << 30]byte)(ptr)[:len(b):len(b)], b)
+	return ptr
+}
+
 func main() {}
@@ -0,0 +1,172 @@
+# K4 Python FFI - Cython fast path
+# BSD 3-Clause License
+#
+# Copyright (c) 2024, Alex Gaetano Padula
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice, this
+#     list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived from
+#     this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# cython: language_level=3
+import os
+from libc.stdint cimport int64_t
+from libc.stdlib cimport free
+from cpython.bytes cimport PyBytes_AsStringAndSize, PyBytes_FromStringAndSize
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+
+# PyUnicode_AsUTF8AndSize returns the UTF-8 representation CPython caches on the str object
+cdef extern from "Python.h":
+    const char* PyUnicode_AsUTF8AndSize(object unicode, Py_ssize_t* size) except NULL
+
+# dladdr reports which shared object a symbol was loaded from
+cdef extern from "dlfcn.h" nogil:
+    ctypedef struct Dl_info:
+        const char* dli_fname
+        void* dli_fbase
+        const char* dli_sname
+        void* dli_saddr
+    int dladdr(const void* addr, Dl_info* info)
+
+# The K4 shared C library symbols, see c/readme.md
+# They are declared nogil so each call can release the GIL like ctypes does
+cdef extern from "libk4.h" nogil:
+    int c_db_put "db_put"(void* dbPtr, char* key, int keyLen, char* value, int valueLen, int64_t ttl)
+    struct db_get_sized_return:
+        void* r0
+        int r1
+    db_get_sized_return c_db_get_sized "db_get_sized"(void* dbPtr, char* key, int keyLen)
+    int c_db_delete "db_delete"(void* dbPtr, char* key, int keyLen)
+    int c_add_operation "add_operation"(void* txPtr, int operation, char* key, int keyLen, char* value, int valueLen)
+
+# library_path returns the path of the shared K4 C library this extension is linked against.
+# k4.py loads the very same file through ctypes, a second copy of the library would start a
+# second Go runtime whose database handles are invalid in this one.
+def library_path():
+    cdef Dl_info info
+    if dladdr(<const void*>&c_db_put, &info) == 0 or info.dli_fname == NULL:
+        raise OSError("could not locate the K4 shared library")
+    return os.fsdecode(<bytes>info.dli_fname)
+
+# _arg points at the data of a key or value for the duration of a call
+cdef struct _arg:
+    const char* data
+    Py_ssize_t size
+    Py_buffer view
+    bint has_view
+
+# _arg_get points a at the cached UTF-8 data of a str, the contents of a bytes object or
+# the buffer of any other object supporting the buffer protocol, none of which copy
+cdef int _arg_get(_arg* a, object x) except -1:
+    a.has_view = False
+    if isinstance(x, str):
+        a.data = PyUnicode_AsUTF8AndSize(x, &a.size)
+    elif isinstance(x, bytes):
+        PyBytes_AsStringAndSize(x, <char**>&a.data, &a.size)
+    else:
+        PyObject_GetBuffer(x, &a.view, PyBUF_SIMPLE)
+        a.has_view = True
+        a.data = <const char*>a.view.buf
+        a.size = a.view.len
+    return 0
+
+# _arg_release releases the buffer held by a, if any
+cdef inline void _arg_release(_arg* a):
+    if a.has_view:
+        PyBuffer_Release(&a.view)
+        a.has_view = False
+
+# _value_obj encodes str values as UTF-8, other values are used as is
+cdef inline object _value_obj(object value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return value
+
+# db_put puts a key-value pair, a ttl of -1 means no expiration
+cpdef int db_put(object db, object key, object value, int64_t ttl=-1) except? -2:
+    cdef void* h = <void*><size_t>db
+    cdef _arg k
+    cdef _arg v
+    cdef int r
+    k.has_view = v.has_view = False
+    value = _value_obj(value)
+    try:
+        _arg_get(&k, key)
+        _arg_get(&v, value)
+        with nogil:
+            r = c_db_put(h, <char*>k.data, <int>k.size, <char*>v.data, <int>v.size, ttl)
+    finally:
+        _arg_release(&k)
+        _arg_release(&v)
+    return r
+
+# db_get returns the value for a key as bytes, or None if it does not exist
+cpdef object db_get(object db, object key):
+    cdef void* h = <void*><size_t>db
+    cdef _arg k
+    cdef db_get_sized_return r
+    k.has_view = False
+    try:
+        _arg_get(&k, key)
+        with nogil:
+            r = c_db_get_sized(h, <char*>k.data, <int>k.size)
+    finally:
+        _arg_release(&k)
+    if r.r0 == NULL:
+        return None
+    try:
+        return PyBytes_FromStringAndSize(<char*>r.r0, r.r1)
+    finally:
+        free(r.r0)
+
+# db_delete deletes a key
+cpdef int db_delete(object db, object key) except? -2:
+    cdef void* h = <void*><size_t>db
+    cdef _arg k
+    cdef int r
+    k.has_view = False
+    try:
+        _arg_get(&k, key)
+        with nogil:
+            r = c_db_delete(h, <char*>k.data, <int>k.size)
+    finally:
+        _arg_release(&k)
+    return r
+
+# add_operation adds an OPR_PUT or OPR_DEL operation to a transaction
+cpdef int add_operation(object txn, int operation, object key, object value=b'') except? -2:
+    cdef void* t = <void*><size_t>txn
+    cdef _arg k
+    cdef _arg v
+    cdef int r
+    k.has_view = v.has_view = False
+    value = _value_obj(value)
+    try:
+        _arg_get(&k, key)
+        _arg_get(&v, value)
+        with nogil:
+            r = c_add_operation(t, operation, <char*>k.data, <int>k.size, <char*>v.data, <int>v.size)
+    finally:
+        _arg_release(&k)
+        _arg_release(&v)
+    return r
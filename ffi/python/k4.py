@@ -29,10 +29,42 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import ctypes
-from ctypes import c_char_p, c_int, c_void_p, c_int64, Structure, POINTER
+import ctypes.util
+import glob
+import os
+import sys
+import threading
+from ctypes import c_char_p, c_int, c_void_p, c_int64, c_uint64, Structure, POINTER
 
-# Load the shared library
-k4 = ctypes.CDLL('libk4.so') # you gotta specify the path to the shared library
+# The shared library is loaded by _load the first time a function is called.
+# Functions loaded through CDLL (unlike PyDLL) release the GIL for the duration of
+# every call, so long running calls such as range_, nrange, recover_from_wal and
+# escalate_compaction do not block other Python threads.
+
+# _find_libk4 returns the path of the shared library. When the Cython extension is
+# present it is the library the extension is linked against, so both share one Go
+# runtime and handle table. Otherwise the K4_LIBRARY environment variable, this
+# module's directory, the k4.libs directory auditwheel vendors it into (renamed
+# libk4-<hash>.so), sys.prefix/lib and LD_LIBRARY_PATH are searched before
+# leaving it to the dynamic linker
+def _find_libk4():
+    if _k4_cy is not None:
+        return _k4_cy.library_path()
+    path = os.environ.get('K4_LIBRARY')
+    if path:
+        return path
+    here = os.path.dirname(os.path.abspath(__file__))
+    if os.path.isfile(os.path.join(here, 'libk4.so')):
+        return os.path.join(here, 'libk4.so')
+    vendored = sorted(glob.glob(os.path.join(here, 'k4.libs', 'libk4*.so*')))
+    if vendored:
+        return vendored[0]
+    dirs = [os.path.join(sys.prefix, 'lib')]
+    dirs += os.environ.get('LD_LIBRARY_PATH', '').split(os.pathsep)
+    for d in dirs:
+        if d and os.path.isfile(os.path.join(d, 'libk4.so')):
+            return os.path.join(d, 'libk4.so')
+    return ctypes.util.find_library('k4') or 'libk4.so'
 
 # KeyValuePair is a structure that holds a key-value pair
 class KeyValuePair(Structure):
@@ -44,6 +76,97 @@ class KeyValuePairArray(Structure):
     _fields_ = [("pairs", POINTER(KeyValuePair)),
                 ("numPairs", c_int)]
 
+# SizedKeyValuePair is a key-value pair with explicit lengths, so keys and values may contain NUL bytes
+class SizedKeyValuePair(Structure):
+    _fields_ = [("key", c_void_p),
+                ("keyLen", c_int),
+                ("value", c_void_p),
+                ("valueLen", c_int)]
+
+# U64KeyValuePair is a key-value pair from range_u64, the key decoded back to an integer
+class U64KeyValuePair(Structure):
+    _fields_ = [("key", c_uint64),
+                ("value", c_void_p),
+                ("valueLen", c_int)]
+
+# U64KeyValuePairArray is a structure that holds an array of U64KeyValuePair's
+class U64KeyValuePairArray(Structure):
+    _fields_ = [("pairs", POINTER(U64KeyValuePair)),
+                ("numPairs", c_int)]
+
+# KVResult wraps a KeyValuePairArray returned by the range functions.
+# Pairs are read straight out of the C array when indexed, as raw bytes,
+# so a scan that stops early never touches the rest of the result.
+# The C memory is freed by close(), at the end of a with block or when the
+# result is garbage collected, after which the result is empty.
+class KVResult:
+    def __init__(self, arr):
+        self._arr = arr
+
+    def __len__(self):
+        return self._arr.numPairs
+
+    def __getitem__(self, i):
+        n = self._arr.numPairs
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("KVResult index out of range")
+        pair = self._arr.pairs[i]
+        return pair.key, pair.value
+
+    def __iter__(self):
+        i = 0
+        while i < self._arr.numPairs:
+            pair = self._arr.pairs[i]
+            yield pair.key, pair.value
+            i += 1
+
+    # decoded yields each (key, value) pair decoded to str
+    def decoded(self):
+        for key, value in self:
+            yield key.decode('utf-8'), value.decode('utf-8')
+
+    # close frees the keys, values and array allocated by the C library
+    def close(self):
+        arr, self._arr = self._arr, KeyValuePairArray()
+        if arr.pairs:
+            _free_kv_array(arr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+# Define the db_get_sized_return structure
+class DbGetSizedReturn(Structure):
+    _fields_ = [("r0", c_void_p),
+                ("r1", c_int)]
+
+# Define the db_get_u64_return structure
+class DbGetU64Return(Structure):
+    _fields_ = [("r0", c_void_p),
+                ("r1", c_int)]
+
+# Define the iter_next_sized_return structure
+class IterNextSizedReturn(Structure):
+    _fields_ = [("r0", c_void_p),
+                ("r1", c_int),
+                ("r2", c_void_p),
+                ("r3", c_int)]
+
+# Define the iter_prev_sized_return structure
+class IterPrevSizedReturn(Structure):
+    _fields_ = [("r0", c_void_p),
+                ("r1", c_int),
+                ("r2", c_void_p),
+                ("r3", c_int)]
+
 # Define the iter_next_return structure
 class IterNextReturn(Structure):
     _fields_ = [("r0", c_char_p),
@@ -54,75 +177,621 @@ class IterPrevReturn(Structure):
     _fields_ = [("r0", c_char_p),
                 ("r1", c_char_p)]
 
-# Define the K4 function prototypes
-k4.db_open.argtypes = [c_char_p, c_int, c_int, c_int, c_int]
-k4.db_open.restype = c_void_p
+# _configure declares the K4 function prototypes on the loaded library
+def _configure(lib):
+    lib.db_open.argtypes = [c_char_p, c_int, c_int, c_int, c_int]
+    lib.db_open.restype = c_void_p
+
+    lib.db_close.argtypes = [c_void_p]
+    lib.db_close.restype = c_int
+
+    lib.db_put.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int, c_int64]
+    lib.db_put.restype = c_int
+
+    lib.db_put_batch.argtypes = [c_void_p, c_int, POINTER(c_char_p), POINTER(c_int), POINTER(c_char_p), POINTER(c_int), POINTER(c_int64)]
+    lib.db_put_batch.restype = c_int
+
+    lib.db_get.argtypes = [c_void_p, c_char_p, c_int]
+    lib.db_get.restype = c_char_p
+
+    lib.db_get_sized.argtypes = [c_void_p, c_char_p, c_int]
+    lib.db_get_sized.restype = DbGetSizedReturn
+
+    lib.db_put_u64.argtypes = [c_void_p, c_uint64, c_char_p, c_int, c_int64]
+    lib.db_put_u64.restype = c_int
+
+    lib.db_get_u64.argtypes = [c_void_p, c_uint64]
+    lib.db_get_u64.restype = DbGetU64Return
+
+    lib.db_delete_u64.argtypes = [c_void_p, c_uint64]
+    lib.db_delete_u64.restype = c_int
+
+    lib.range_u64.argtypes = [c_void_p, c_uint64, c_uint64]
+    lib.range_u64.restype = U64KeyValuePairArray
+
+    lib.db_delete.argtypes = [c_void_p, c_char_p, c_int]
+    lib.db_delete.restype = c_int
+
+    lib.begin_transaction.argtypes = [c_void_p]
+    lib.begin_transaction.restype = c_void_p
+
+    lib.add_operation.argtypes = [c_void_p, c_int, c_char_p, c_int, c_char_p, c_int]
+    lib.add_operation.restype = c_int
+
+    lib.add_operation_batch.argtypes = [c_void_p, c_int, POINTER(c_int), POINTER(c_char_p), POINTER(c_int), POINTER(c_char_p), POINTER(c_int)]
+    lib.add_operation_batch.restype = c_int
+
+    lib.db_write_batch.argtypes = [c_void_p, c_int, POINTER(c_int), POINTER(c_char_p), POINTER(c_int), POINTER(c_char_p), POINTER(c_int)]
+    lib.db_write_batch.restype = c_int
+
+    lib.remove_transaction.argtypes = [c_void_p, c_void_p]
+
+    lib.commit_transaction.argtypes = [c_void_p, c_void_p]
+    lib.commit_transaction.restype = c_int
+
+    lib.rollback_transaction.argtypes = [c_void_p, c_void_p]
+    lib.rollback_transaction.restype = c_int
+
+    lib.recover_from_wal.argtypes = [c_void_p]
+    lib.recover_from_wal.restype = c_int
+
+    lib.range_.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int]
+    lib.range_.restype = KeyValuePairArray
+
+    lib.range_filter.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int, c_int, c_char_p, c_int]
+    lib.range_filter.restype = KeyValuePairArray
+
+    lib.nrange.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int]
+    lib.nrange.restype = KeyValuePairArray
+
+    lib.greater_than.argtypes = [c_void_p, c_char_p, c_int]
+    lib.greater_than.restype = KeyValuePairArray
+
+    lib.less_than.argtypes = [c_void_p, c_char_p, c_int]
+    lib.less_than.restype = KeyValuePairArray
+
+    lib.nget.argtypes = [c_void_p, c_char_p, c_int]
+    lib.nget.restype = KeyValuePairArray
+
+    lib.greater_than_eq.argtypes = [c_void_p, c_char_p, c_int]
+    lib.greater_than_eq.restype = KeyValuePairArray
+
+    lib.less_than_eq.argtypes = [c_void_p, c_char_p, c_int]
+    lib.less_than_eq.restype = KeyValuePairArray
+
+    lib.new_iterator.argtypes = [c_void_p]
+    lib.new_iterator.restype = c_void_p
+
+    lib.iter_next.argtypes = [c_void_p]
+    lib.iter_next.restype = IterNextReturn
+
+    lib.iter_prev.argtypes = [c_void_p]
+    lib.iter_prev.restype = IterPrevReturn
+
+    lib.iter_next_sized.argtypes = [c_void_p]
+    lib.iter_next_sized.restype = IterNextSizedReturn
+
+    lib.iter_prev_sized.argtypes = [c_void_p]
+    lib.iter_prev_sized.restype = IterPrevSizedReturn
+
+    lib.iter_next_batch.argtypes = [c_void_p, POINTER(SizedKeyValuePair), c_int]
+    lib.iter_next_batch.restype = c_int
+
+    lib.iter_reset.argtypes = [c_void_p]
+
+    lib.iter_close.argtypes = [c_void_p]
+
+    lib.escalate_flush.argtypes = [c_void_p]
+    lib.escalate_flush.restype = c_int
+
+    lib.escalate_compaction.argtypes = [c_void_p]
+    lib.escalate_compaction.restype = c_int
+
+    lib.free_kv_pairs.argtypes = [POINTER(KeyValuePair), c_int]
+
+    lib.free_sized_kv_pairs.argtypes = [POINTER(SizedKeyValuePair), c_int]
+
+    lib.free_kv_array.argtypes = [KeyValuePairArray]
+
+    lib.free_u64_kv_array.argtypes = [U64KeyValuePairArray]
+
+    lib.free_value.argtypes = [c_void_p]
+
+# The C functions used by the wrappers below, each is bound to a module level
+# _<name> so a call is a global lookup rather than an attribute lookup on the library
+_FUNCTIONS = [
+    'db_open',
+    'db_close',
+    'db_put',
+    'db_put_batch',
+    'free_value',
+    'db_get_sized',
+    'db_delete',
+    'db_put_u64',
+    'db_get_u64',
+    'db_delete_u64',
+    'range_u64',
+    'begin_transaction',
+    'add_operation',
+    'add_operation_batch',
+    'db_write_batch',
+    'remove_transaction',
+    'commit_transaction',
+    'rollback_transaction',
+    'recover_from_wal',
+    'range_',
+    'range_filter',
+    'nrange',
+    'greater_than',
+    'less_than',
+    'nget',
+    'greater_than_eq',
+    'less_than_eq',
+    'new_iterator',
+    'iter_next_sized',
+    'iter_prev_sized',
+    'iter_next_batch',
+    'free_kv_pairs',
+    'free_sized_kv_pairs',
+    'free_kv_array',
+    'free_u64_kv_array',
+    'iter_reset',
+    'iter_close',
+    'escalate_flush',
+    'escalate_compaction',
+]
+
+_load_lock = threading.Lock()
+
+# _load loads and configures the shared library, then rebinds every _<name> to the
+# real C function, so the library is only loaded once a wrapper is first called
+def _load():
+    global k4
+    with _load_lock:
+        if 'k4' in globals():
+            return k4
+        # RTLD_LAZY resolves symbols as they are first called instead of all up front
+        mode = getattr(os, 'RTLD_LAZY', 0) | getattr(os, 'RTLD_LOCAL', 0)
+        lib = ctypes.CDLL(_find_libk4(), mode=mode or ctypes.DEFAULT_MODE)
+        _configure(lib)
+        for name in _FUNCTIONS:
+            globals()['_' + name] = getattr(lib, name)
+        k4 = lib
+        return lib
+
+# _lazy returns a stand-in for the C function name that loads the library on first call
+def _lazy(name):
+    def call(*args):
+        _load()
+        return globals()['_' + name](*args)
+    return call
+
+for _name in _FUNCTIONS:
+    globals()['_' + _name] = _lazy(_name)
+
+# The raw ctypes bindings are available as k4.k4, loading the library on first access
+def __getattr__(name):
+    if name == 'k4':
+        return _load()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+# Operation codes for add_operation
+OPR_PUT = 0
+OPR_DEL = 1
+
+# Filter operations for range_filter
+FILTER_EQ = 0
+FILTER_NEQ = 1
+FILTER_GT = 2
+FILTER_LT = 3
+FILTER_PREFIX = 4
+
+# _as_bytes returns a key or value as bytes, str is encoded as UTF-8, bytes are passed
+# through without a copy and anything else must support the buffer protocol
+def _as_bytes(value):
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, bytes):
+        return value
+    return bytes(memoryview(value))
+
+# _check_operations raises ValueError unless every operation is OPR_PUT or OPR_DEL,
+# the C library would otherwise hang committing an unknown operation
+def _check_operations(operations):
+    for op in operations:
+        if op != OPR_PUT and op != OPR_DEL:
+            raise ValueError("invalid operation %r, expected OPR_PUT or OPR_DEL" % (op,))
+
+# _check_filter raises ValueError unless op is one of the FILTER_ operations, the C
+# library returns an empty result for an unknown one which looks like no matches
+def _check_filter(op):
+    if op not in (FILTER_EQ, FILTER_NEQ, FILTER_GT, FILTER_LT, FILTER_PREFIX):
+        raise ValueError("invalid filter operation %r, expected one of the FILTER_ constants" % (op,))
+
+# _u64 returns key unchanged if it fits in an unsigned 64-bit integer and raises
+# OverflowError otherwise, ctypes would silently wrap it onto another key
+def _u64(key):
+    if not 0 <= key < 1 << 64:
+        raise OverflowError("numeric key %r out of range for an unsigned 64-bit integer" % (key,))
+    return key
+
+# Values of at least this many bytes held in a writable buffer are passed to the
+# C library in place rather than copied into bytes first
+_LARGE_VALUE = 65536
+
+# _value_arg returns a value ready to be passed as a char*, a large writable bytearray
+# or memoryview is wrapped without copying, everything else goes through _as_bytes
+def _value_arg(value):
+    if isinstance(value, (bytearray, memoryview)):
+        view = memoryview(value)
+        if view.nbytes >= _LARGE_VALUE and not view.readonly and view.c_contiguous:
+            return (ctypes.c_char * view.nbytes).from_buffer(view)
+    return _as_bytes(value)
+
+# db_open opens a K4 database at the given directory and returns its handle
+def db_open(directory, memtable_flush_threshold, compaction_interval, logging=False, compress=False):
+    return _db_open(_as_bytes(directory), memtable_flush_threshold, compaction_interval, int(logging), int(compress))
+
+# db_close closes the database behind the handle
+def db_close(db):
+    return _db_close(db)
+
+# db_put puts a key-value pair, a ttl of -1 means no expiration
+def db_put(db, key, value, ttl=-1):
+    k = _as_bytes(key)
+    v = _value_arg(value)
+    return _db_put(db, k, len(k), v, len(v), ttl)
+
+# db_put_many puts all key-value pairs with a single call into the C library,
+# ttls defaults to no expiration for every pair. It is not atomic, it stops at
+# the first failed put and returns -1 with the pairs before it already written,
+# use a WriteBatch to apply all pairs or none
+def db_put_many(db, keys, values, ttls=None):
+    n = len(keys)
+    if ttls is None:
+        ttls = [-1] * n
+    if len(values) != n or len(ttls) != n:
+        raise ValueError("keys, values and ttls must have the same length")
+    ks = [_as_bytes(key) for key in keys]
+    vs = [_as_bytes(value) for value in values]
+    return _db_put_batch(db, n,
+                           (c_char_p * n)(*ks), (c_int * n)(*map(len, ks)),
+                           (c_char_p * n)(*vs), (c_int * n)(*map(len, vs)),
+                           (c_int64 * n)(*ttls))
+
+# _take copies a sized buffer returned by the C library into bytes and frees it
+def _take(ptr, size):
+    try:
+        return ctypes.string_at(ptr, size)
+    finally:
+        _free_value(ptr)
+
+# db_get returns the value for a key as bytes, or None if it does not exist
+def db_get(db, key):
+    k = _as_bytes(key)
+    r = _db_get_sized(db, k, len(k))
+    if not r.r0:
+        return None
+    return _take(r.r0, r.r1)
+
+# db_delete deletes a key
+def db_delete(db, key):
+    k = _as_bytes(key)
+    return _db_delete(db, k, len(k))
+
+# db_put_u64 puts a value under a numeric key, stored as 8 big-endian bytes
+# so numeric keys sort in order, a ttl of -1 means no expiration
+def db_put_u64(db, key, value, ttl=-1):
+    v = _value_arg(value)
+    return _db_put_u64(db, _u64(key), v, len(v), ttl)
+
+# db_get_u64 returns the value for a numeric key as bytes, or None if it does not exist
+def db_get_u64(db, key):
+    r = _db_get_u64(db, _u64(key))
+    if not r.r0:
+        return None
+    return _take(r.r0, r.r1)
+
+# db_delete_u64 deletes a numeric key
+def db_delete_u64(db, key):
+    return _db_delete_u64(db, _u64(key))
+
+# range_u64 returns the (key, value) pairs with numeric keys between start and end,
+# keys as int and values as bytes
+def range_u64(db, start, end):
+    arr = _range_u64(db, _u64(start), _u64(end))
+    try:
+        return [(pair.key, ctypes.string_at(pair.value, pair.valueLen)) for pair in arr.pairs[:arr.numPairs]]
+    finally:
+        if arr.pairs:
+            _free_u64_kv_array(arr)
+
+# begin_transaction begins a new transaction and returns its handle
+def begin_transaction(db):
+    return _begin_transaction(db)
+
+# add_operation adds an OPR_PUT or OPR_DEL operation to a transaction
+def add_operation(txn, operation, key, value=''):
+    k = _as_bytes(key)
+    v = _value_arg(value)
+    return _add_operation(txn, operation, k, len(k), v, len(v))
+
+# add_operation_many adds all operations to a transaction with a single call into the C library
+def add_operation_many(txn, operations, keys, values):
+    n = len(operations)
+    if len(keys) != n or len(values) != n:
+        raise ValueError("operations, keys and values must have the same length")
+    _check_operations(operations)
+    ks = [_as_bytes(key) for key in keys]
+    vs = [_as_bytes(value) for value in values]
+    return _add_operation_batch(txn, n, (c_int * n)(*operations),
+                                  (c_char_p * n)(*ks), (c_int * n)(*map(len, ks)),
+                                  (c_char_p * n)(*vs), (c_int * n)(*map(len, vs)))
+
+# WriteBatch collects puts and deletes in Python and applies them to the database
+# atomically with a single db_write_batch call on commit, readers see either none
+# or all of the batch. Write batches do not support a TTL.
+class WriteBatch:
+    def __init__(self):
+        self._ops = []
+        self._keys = []
+        self._values = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    # put queues a put of a key-value pair
+    def put(self, key, value):
+        self._ops.append(OPR_PUT)
+        self._keys.append(_as_bytes(key))
+        self._values.append(_as_bytes(value))
+
+    # delete queues a delete of a key
+    def delete(self, key):
+        self._ops.append(OPR_DEL)
+        self._keys.append(_as_bytes(key))
+        self._values.append(b'')
+
+    # clear drops all queued operations
+    def clear(self):
+        self._ops, self._keys, self._values = [], [], []
+
+    # commit applies the queued operations to db and clears the batch on success
+    def commit(self, db):
+        n = len(self._ops)
+        if n == 0:
+            return 0
+        ks, vs = self._keys, self._values
+        r = _db_write_batch(db, n, (c_int * n)(*self._ops),
+                            (c_char_p * n)(*ks), (c_int * n)(*map(len, ks)),
+                            (c_char_p * n)(*vs), (c_int * n)(*map(len, vs)))
+        if r == 0:
+            self.clear()
+        return r
+
+# remove_transaction removes a transaction from the database
+def remove_transaction(db, txn):
+    _remove_transaction(db, txn)
+
+# commit_transaction commits a transaction
+def commit_transaction(txn, db):
+    return _commit_transaction(txn, db)
+
+# rollback_transaction rolls back a committed transaction
+def rollback_transaction(txn, db):
+    return _rollback_transaction(txn, db)
+
+# Transaction collects encoded operations in Python and hands them to the C library
+# with a single add_operation_batch call when committed.
+# Used as a context manager it commits when the block succeeds and discards the
+# operations when it raises, either way the transaction is removed afterwards.
+class Transaction:
+    def __init__(self, db):
+        self._db = db
+        self._txn = _begin_transaction(db)
+        self._ops = []
+        self._keys = []
+        self._values = []
+
+    # add_operation queues an OPR_PUT or OPR_DEL operation
+    def add_operation(self, operation, key, value=b''):
+        _check_operations((operation,))
+        self._ops.append(operation)
+        self._keys.append(_as_bytes(key))
+        self._values.append(_as_bytes(value))
+
+    # put queues a put of a key-value pair
+    def put(self, key, value):
+        self.add_operation(OPR_PUT, key, value)
+
+    # delete queues a delete of a key
+    def delete(self, key):
+        self.add_operation(OPR_DEL, key)
+
+    # _handle returns the transaction handle, raising ValueError once the transaction is closed
+    def _handle(self):
+        if self._txn is None:
+            raise ValueError("transaction is closed")
+        return self._txn
+
+    # _flush adds the queued operations to the transaction with a single call
+    def _flush(self):
+        txn = self._handle()
+        n = len(self._ops)
+        if n:
+            ks, vs = self._keys, self._values
+            r = _add_operation_batch(txn, n, (c_int * n)(*self._ops),
+                                     (c_char_p * n)(*ks), (c_int * n)(*map(len, ks)),
+                                     (c_char_p * n)(*vs), (c_int * n)(*map(len, vs)))
+            if r != 0:
+                return r
+            self._ops, self._keys, self._values = [], [], []
+        return 0
+
+    # commit adds the queued operations to the transaction and commits it
+    def commit(self):
+        r = self._flush()
+        if r != 0:
+            return r
+        return _commit_transaction(self._txn, self._db)
+
+    # rollback rolls back a committed transaction
+    def rollback(self):
+        return _rollback_transaction(self._handle(), self._db)
+
+    # close removes the transaction from the database
+    def close(self):
+        if self._txn is not None:
+            _remove_transaction(self._db, self._txn)
+            self._txn = None
 
-k4.db_close.argtypes = [c_void_p]
-k4.db_close.restype = c_int
+    def __enter__(self):
+        return self
 
-k4.db_put.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int, c_int64]
-k4.db_put.restype = c_int
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # Nothing has been applied if the operations could not be added,
+                # only a failed commit leaves partial writes to roll back
+                if self._flush() != 0:
+                    raise RuntimeError("failed to add operations to transaction")
+                if _commit_transaction(self._txn, self._db) != 0:
+                    self.rollback()
+                    raise RuntimeError("failed to commit transaction")
+        finally:
+            self.close()
+        return False
 
-k4.db_get.argtypes = [c_void_p, c_char_p, c_int]
-k4.db_get.restype = c_char_p
+# recover_from_wal replays the write-ahead log into the database
+def recover_from_wal(db):
+    return _recover_from_wal(db)
 
-k4.db_delete.argtypes = [c_void_p, c_char_p, c_int]
-k4.db_delete.restype = c_int
+# range_ returns all key-value pairs between start and end
+def range_(db, start, end):
+    s = _as_bytes(start)
+    e = _as_bytes(end)
+    return KVResult(_range_(db, s, len(s), e, len(e)))
 
-k4.begin_transaction.argtypes = [c_void_p]
-k4.begin_transaction.restype = c_void_p
+# range_filter returns all key-value pairs between start and end whose value matches
+# the FILTER_ operation against value, pairs are filtered before they leave the C library
+def range_filter(db, start, end, op, value):
+    _check_filter(op)
+    s = _as_bytes(start)
+    e = _as_bytes(end)
+    v = _as_bytes(value)
+    return KVResult(_range_filter(db, s, len(s), e, len(e), op, v, len(v)))
 
-k4.add_operation.argtypes = [c_void_p, c_int, c_char_p, c_int, c_char_p, c_int]
-k4.add_operation.restype = c_int
+# nrange returns all key-value pairs not between start and end
+def nrange(db, start, end):
+    s = _as_bytes(start)
+    e = _as_bytes(end)
+    return KVResult(_nrange(db, s, len(s), e, len(e)))
 
-k4.remove_transaction.argtypes = [c_void_p, c_void_p]
+# greater_than returns all key-value pairs with keys greater than key
+def greater_than(db, key):
+    k = _as_bytes(key)
+    return KVResult(_greater_than(db, k, len(k)))
 
-k4.commit_transaction.argtypes = [c_void_p, c_void_p]
-k4.commit_transaction.restype = c_int
+# less_than returns all key-value pairs with keys less than key
+def less_than(db, key):
+    k = _as_bytes(key)
+    return KVResult(_less_than(db, k, len(k)))
 
-k4.rollback_transaction.argtypes = [c_void_p, c_void_p]
-k4.rollback_transaction.restype = c_int
+# nget returns all key-value pairs except the one for key
+def nget(db, key):
+    k = _as_bytes(key)
+    return KVResult(_nget(db, k, len(k)))
 
-k4.recover_from_wal.argtypes = [c_void_p]
-k4.recover_from_wal.restype = c_int
+# greater_than_eq returns all key-value pairs with keys greater than or equal to key
+def greater_than_eq(db, key):
+    k = _as_bytes(key)
+    return KVResult(_greater_than_eq(db, k, len(k)))
 
-k4.range_.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int]
-k4.range_.restype = KeyValuePairArray
+# less_than_eq returns all key-value pairs with keys less than or equal to key
+def less_than_eq(db, key):
+    k = _as_bytes(key)
+    return KVResult(_less_than_eq(db, k, len(k)))
 
-k4.nrange.argtypes = [c_void_p, c_char_p, c_int, c_char_p, c_int]
-k4.nrange.restype = KeyValuePairArray
+# new_iterator creates a new iterator over the database
+def new_iterator(db):
+    return _new_iterator(db)
 
-k4.greater_than.argtypes = [c_void_p, c_char_p, c_int]
-k4.greater_than.restype = KeyValuePairArray
+# iter_next_bytes returns the next (key, value) pair as bytes, or None when exhausted
+def iter_next_bytes(it):
+    r = _iter_next_sized(it)
+    if not r.r0:
+        return None
+    return _take(r.r0, r.r1), _take(r.r2, r.r3)
 
-k4.less_than.argtypes = [c_void_p, c_char_p, c_int]
-k4.less_than.restype = KeyValuePairArray
+# iter_prev_bytes returns the previous (key, value) pair as bytes, or None when exhausted
+def iter_prev_bytes(it):
+    r = _iter_prev_sized(it)
+    if not r.r0:
+        return None
+    return _take(r.r0, r.r1), _take(r.r2, r.r3)
 
-k4.nget.argtypes = [c_void_p, c_char_p, c_int]
-k4.nget.restype = KeyValuePairArray
+# iter_next returns the next (key, value) pair as strings, or None when exhausted
+def iter_next(it):
+    pair = iter_next_bytes(it)
+    if pair is None:
+        return None
+    return pair[0].decode('utf-8'), pair[1].decode('utf-8')
 
-k4.greater_than_eq.argtypes = [c_void_p, c_char_p, c_int]
-k4.greater_than_eq.restype = KeyValuePairArray
+# iter_prev returns the previous (key, value) pair as strings, or None when exhausted
+def iter_prev(it):
+    pair = iter_prev_bytes(it)
+    if pair is None:
+        return None
+    return pair[0].decode('utf-8'), pair[1].decode('utf-8')
 
-k4.less_than_eq.argtypes = [c_void_p, c_char_p, c_int]
-k4.less_than_eq.restype = KeyValuePairArray
+# BatchIter iterates forward over a K4 iterator yielding (key, value) pairs as bytes.
+# Pairs are pulled batch_size at a time with a single call into the C library
+# and copied out of a buffer that is reused for every batch.
+class BatchIter:
+    def __init__(self, it, batch_size=1024):
+        self._it = it
+        self._size = batch_size
+        self._buf = (SizedKeyValuePair * batch_size)()
+        self._batch = []
+        self._pos = 0
 
-k4.new_iterator.argtypes = [c_void_p]
-k4.new_iterator.restype = c_void_p
+    def __iter__(self):
+        return self
 
-k4.iter_next.argtypes = [c_void_p]
-k4.iter_next.restype = IterNextReturn
+    def __next__(self):
+        if self._pos == len(self._batch):
+            n = _iter_next_batch(self._it, self._buf, self._size)
+            if n == 0:
+                raise StopIteration
+            self._batch = [(ctypes.string_at(pair.key, pair.keyLen), ctypes.string_at(pair.value, pair.valueLen))
+                           for pair in self._buf[:n]]
+            self._pos = 0
+            _free_sized_kv_pairs(self._buf, n)
+        pair = self._batch[self._pos]
+        self._pos += 1
+        return pair
 
-k4.iter_prev.argtypes = [c_void_p]
-k4.iter_prev.restype = IterPrevReturn
+# iter_reset resets the iterator
+def iter_reset(it):
+    _iter_reset(it)
 
-k4.iter_reset.argtypes = [c_void_p]
+# iter_close closes the iterator
+def iter_close(it):
+    _iter_close(it)
 
-k4.iter_close.argtypes = [c_void_p]
+# escalate_flush forces a memtable flush
+def escalate_flush(db):
+    return _escalate_flush(db)
 
-k4.escalate_flush.argtypes = [c_void_p]
-k4.escalate_flush.restype = c_int
+# escalate_compaction forces a compaction
+def escalate_compaction(db):
+    return _escalate_compaction(db)
 
-k4.escalate_compaction.argtypes = [c_void_p]
-k4.escalate_compaction.restype = c_int
\ No newline at end of file
+# Use the Cython fast path for point operations when it has been built,
+# otherwise the ctypes wrappers above are used
+try:
+    import _k4_cy
+except ImportError:
+    _k4_cy = None
+else:
+    from _k4_cy import db_put, db_get, db_delete, add_operation
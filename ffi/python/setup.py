@@ -0,0 +1,74 @@
+# K4 Python FFI - build script
+# BSD 3-Clause License
+#
+# Copyright (c) 2024, Alex Gaetano Padula
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice, this
+#     list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its
+#     contributors may be used to endorse or promote products derived from
+#     this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import sys
+from setuptools import setup, Extension
+
+# The Cython extension is an optional fast path, without Cython only the ctypes
+# module is installed
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# The extension only uses the stable ABI of CPython 3.11+, so a single abi3 wheel
+# covers every later interpreter
+LIMITED_API = 0x030B0000
+
+extra_compile_args = []
+if sys.platform != "win32":
+    extra_compile_args = ["-O3", "-fno-semantic-interposition"]
+    # K4_MARCH opts into a newer instruction set, e.g. K4_MARCH=x86-64-v3,
+    # at the cost of the build not running on older CPUs
+    if os.environ.get("K4_MARCH"):
+        extra_compile_args.append("-march=" + os.environ["K4_MARCH"])
+
+# The _k4_cy extension links against the shared K4 C library, see c/readme.md.
+# It is optional, if the library or its header is missing the build skips it
+# and k4.py falls back to ctypes
+extensions = [
+    Extension("_k4_cy", ["_k4_cy.pyx"],
+              include_dirs=["/usr/local/include"],
+              library_dirs=["/usr/local/lib"],
+              # dladdr lives in libdl before glibc 2.34
+              libraries=["k4", "dl"] if sys.platform.startswith("linux") else ["k4"],
+              define_macros=[("Py_LIMITED_API", hex(LIMITED_API)), ("CYTHON_LIMITED_API", "1")],
+              extra_compile_args=extra_compile_args,
+              py_limited_api=True,
+              optional=True),
+]
+
+setup(
+    name="k4",
+    py_modules=["k4"],
+    ext_modules=cythonize(extensions, language_level=3) if cythonize else [],
+    options={"bdist_wheel": {"py_limited_api": "cp311"}},
+)